@@ -1,4 +1,3 @@
-# encoding: utf-8
 from setuptools import setup
 
 setup(use_scm_version=True)
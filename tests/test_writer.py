@@ -81,6 +81,22 @@ def test_vcd_flush(capsys):
     assert lines[-1] == '#17'
 
 
+def test_vcd_buffered_output(capsys):
+    vcd = VCDWriter(sys.stdout, date='today')
+    var = vcd.register_var('sss', 'nnn', 'integer', 32)
+    vcd.change(var, 1, 10)
+    assert not split_lines(capsys)
+    vcd.flush()
+    assert split_lines(capsys)[-2:] == ['#1', 'b1010 !']
+    for timestamp in range(2, 10000):
+        vcd.change(var, timestamp, timestamp)
+    lines = split_lines(capsys)
+    assert lines
+    assert lines[-1] != 'b10011100001111 !'
+    vcd.close()
+    assert split_lines(capsys)[-1] == 'b10011100001111 !'
+
+
 def test_vcd_close(capsys):
     vcd = VCDWriter(sys.stdout, date='')
     assert not split_lines(capsys)
@@ -104,6 +120,66 @@ def test_vcd_change_after_close(capsys):
         vcd.flush()
 
 
+def test_vcd_dump_off_on_after_close(capsys):
+    vcd = VCDWriter(sys.stdout, date='')
+    vcd.register_var('a', 'b', 'integer')
+    vcd.close()
+    assert split_lines(capsys)
+    with pytest.raises(VCDPhaseError):
+        vcd.dump_off(1)
+    with pytest.raises(VCDPhaseError):
+        vcd.dump_on(2)
+    assert not split_lines(capsys)
+
+
+def test_vcd_change_phases(capsys):
+    vcd = VCDWriter(sys.stdout, date='')
+    var = vcd.register_var('a', 'b', 'integer', 8)
+    vcd.change(var, 1, 1)
+    with pytest.raises(VCDPhaseError):
+        vcd.change(var, 0, 2)
+    with pytest.raises(ValueError):
+        vcd.change(var, 1, 256)
+    vcd.dump_off(2)
+    vcd.change(var, 3, 3)
+    with pytest.raises(VCDPhaseError):
+        vcd.change(var, 2, 4)
+    with pytest.raises(ValueError):
+        vcd.change(var, 3, 'eight')
+    vcd.dump_on(4)
+    vcd.close()
+    with pytest.raises(VCDPhaseError):
+        vcd.change(var, 5, 5)
+    assert split_lines(capsys)[-10:] == [
+        '#1',
+        'b1 !',
+        '#2',
+        '$dumpoff',
+        'bx !',
+        '$end',
+        '#4',
+        '$dumpon',
+        'b11 !',
+        '$end',
+    ]
+
+
+def test_vcd_change_subclass(capsys):
+    class CountingVCDWriter(VCDWriter):
+        count = 0
+
+        def change(self, var, timestamp, value):
+            self.count += 1
+            super().change(var, timestamp, value)
+
+    with CountingVCDWriter(sys.stdout, date='') as vcd:
+        var = vcd.register_var('a', 'b', 'integer', 8)
+        for timestamp in range(3):
+            vcd.change(var, timestamp, timestamp)
+    assert vcd.count == 3
+    assert split_lines(capsys)[-2:] == ['#2', 'b10 !']
+
+
 def test_vcd_alias_after_close(capsys):
     vcd = VCDWriter(sys.stdout)
     var = vcd.register_var('a', 'b', 'integer')
@@ -148,6 +224,25 @@ def test_vcd_invalid_vector_init():
             vcd.register_var('scope', 'b', 'integer', 8, init=8.0)
 
 
+def test_vcd_unchecked_vector_out_of_range(capsys):
+    with VCDWriter(sys.stdout, date='', check_values=False) as vcd:
+        v = vcd.register_var('s', 'v', 'reg', 8)
+        c = vcd.register_var('s', 'c', 'reg', (4, 4))
+        vcd.change(v, 1, 256)
+        vcd.change(c, 1, (16, 1))
+        vcd.change(v, 2, -200)
+        vcd.change(v, 3, -1)
+    assert split_lines(capsys)[-7:] == [
+        '#1',
+        'b100000000 !',
+        'b100000001 "',
+        '#2',
+        'b111000 !',
+        '#3',
+        'b11111111 !',
+    ]
+
+
 def test_vcd_no_duplicates(capsys):
     with VCDWriter(sys.stdout, date='today') as vcd:
         var = vcd.register_var('sss', 'nnn', 'integer', 32)
@@ -178,6 +273,57 @@ def test_vcd_no_duplicates(capsys):
     ]
 
 
+def test_vcd_register_vars(capsys):
+    with VCDWriter(sys.stdout, date='today') as vcd:
+        v0, v1, v2 = vcd.register_vars(
+            [
+                ('sss', 'aaa', 'integer'),
+                ('sss', 'bbb', 'wire', 1),
+                ('sss.ttt', 'ccc', 'reg', 4, 5),
+            ]
+        )
+        with pytest.raises(KeyError):
+            vcd.register_vars([('sss', 'ddd', 'wire', 1), ('sss', 'aaa', 'integer')])
+        with pytest.raises(KeyError):
+            vcd.register_vars([('sss', 'ddd', 'wire', 1), ('sss', 'ddd', 'wire', 1)])
+        with pytest.raises(ValueError):
+            vcd.register_vars([('sss', 'ddd', 'wire', 1), ('sss', 'eee', 'bogus')])
+        with pytest.raises(ValueError):
+            vcd.register_vars([('sss', 'ddd', 'wire', 1), ('sss', 'eee', 'reg', 4, 16)])
+        # Failed batches register nothing, so retrying a corrected batch succeeds.
+        (v3,) = vcd.register_vars([('sss', 'ddd', 'wire', 1)])
+        vcd.change(v1, 1, 1)
+    assert isinstance(v0, VectorVariable)
+    assert isinstance(v2, VectorVariable)
+    assert v3.ident == '$'
+    lines = split_lines(capsys)
+    assert [line for line in lines if 'ddd' in line] == ['$var wire 1 $ ddd $end']
+    assert lines == [
+        '$date today $end',
+        '$timescale 1 us $end',
+        '$scope module sss $end',
+        '$var integer 64 ! aaa $end',
+        '$var wire 1 " bbb $end',
+        '$var wire 1 $ ddd $end',
+        '$scope module ttt $end',
+        '$var reg 4 # ccc $end',
+        '$upscope $end',
+        '$upscope $end',
+        '$enddefinitions $end',
+        '#0',
+        '$dumpvars',
+        'bx !',
+        'x"',
+        'b101 #',
+        'x$',
+        '$end',
+        '#1',
+        '1"',
+    ]
+    with pytest.raises(VCDPhaseError):
+        vcd.register_vars([('sss', 'eee', 'integer')])
+
+
 def test_vcd_aliases(capsys):
     with VCDWriter(sys.stdout, date='today') as vcd:
         var = vcd.register_var('sss', 'nnn', 'integer', 32)
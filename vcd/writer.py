@@ -4,14 +4,16 @@ This module provides :class:`VCDWriter` for writing VCD files.
 
 """
 from datetime import datetime
-from itertools import zip_longest
+from functools import lru_cache
 from numbers import Number
 from types import TracebackType
 from typing import (
     IO,
+    ClassVar,
     Dict,
     Generator,
     Generic,
+    Iterable,
     List,
     Optional,
     Sequence,
@@ -47,6 +49,36 @@ ScalarValue = Union[int, bool, str, None]
 StringValue = Union[str, None]
 CompoundValue = Sequence[ScalarValue]
 VarValue = Union[EventValue, RealValue, ScalarValue, StringValue, CompoundValue]
+VarSpec = Union[
+    Tuple[ScopeInput, str, Union[VarType, str]],
+    Tuple[ScopeInput, str, Union[VarType, str], Optional[VariableSize]],
+    Tuple[ScopeInput, str, Union[VarType, str], Optional[VariableSize], VarValue],
+]
+
+#: Value change character for the common scalar values.
+_SCALAR_VALUE_CHARS: Dict[ScalarValue, str] = {
+    '0': '0',
+    '1': '1',
+    'x': 'x',
+    'X': 'X',
+    'z': 'z',
+    'Z': 'Z',
+    True: '1',
+    False: '0',
+    None: 'z',
+}
+
+#: Valid scalar value characters.
+_SCALAR_CHARS = frozenset('01xzXZ')
+
+#: Valid characters in vector value strings.
+_VECTOR_CHARS = frozenset('01xzXZ-')
+
+#: Order in which header keywords are emitted.
+_HEADER_KEYWORD_ORDER = ('$comment', '$date', '$timescale', '$version')
+
+#: Number of buffered characters that triggers a write to the output file.
+_BUF_SIZE = 64 * 1024
 
 
 class VCDWriter:
@@ -68,6 +100,13 @@ class VCDWriter:
     :param int init_timestamp: The initial timestamp. default=0
     :raises ValueError: for invalid timescale values
 
+    .. Note::
+
+        VCD data is buffered internally and only written to *file* in large blocks.
+        :meth:`close()` (or :meth:`flush()`) must be called, e.g. by using the writer
+        as a context manager, to write out the final block; a writer discarded
+        without being closed loses any data still buffered.
+
     """
 
     def __init__(
@@ -99,9 +138,16 @@ class VCDWriter:
         self._scope_var_strs: Dict[ScopeTuple, List[str]] = {}
         self._scope_var_names: Dict[ScopeTuple, Set[str]] = {}
         self._scope_types: Dict[ScopeTuple, ScopeType] = {}
+        self._scope_cache: Dict[str, ScopeTuple] = {}
         self._vars: List[Variable] = []
         self._timestamp = int(init_timestamp)
         self._last_dumped_ts: Optional[int] = None
+        self._dump_off_str: Optional[str] = None
+        self._buf: List[str] = []
+        self._buf_len = 0
+        # Bound methods used on the value change path.
+        self._buf_append = self._buf.append
+        self._ofile_write = file.write
 
     def set_scope_type(
         self, scope: ScopeInput, scope_type: Union[ScopeType, str]
@@ -157,12 +203,70 @@ class VCDWriter:
             raise VCDPhaseError('Cannot register after close().')
         elif not self._registering:
             raise VCDPhaseError('Cannot register after time 0.')
+        scope_tuple, var_str, var = self._make_var(
+            self._next_var_id, scope, name, var_type, size, init
+        )
+        self._add_var(scope_tuple, name, var_str, var)
+        return var
+
+    def register_vars(self, specs: Iterable[VarSpec]) -> List['Variable']:
+        """Register multiple VCD variables.
+
+        This is equivalent to calling :meth:`register_var()` for each spec, but
+        avoids repeating the per-call phase checks when registering many variables.
+        All specs are validated before any variable is registered; if any spec is
+        invalid, none of the variables are registered.
+
+        :param specs:
+            Iterable of ``(scope, name, var_type[, size[, init]])`` tuples, with the
+            same meaning as the corresponding :meth:`register_var()` parameters.
+        :raises VCDPhaseError: if any values have been changed
+        :raises ValueError: for invalid var_type value
+        :raises TypeError: for invalid parameter types
+        :raises KeyError: for duplicate var name
+        :returns: list of :class:`Variable` instances, in the same order as *specs*.
+
+        """
+        if self._closed:
+            raise VCDPhaseError('Cannot register after close().')
+        elif not self._registering:
+            raise VCDPhaseError('Cannot register after time 0.')
+
+        make_var = self._make_var
+        next_var_id = self._next_var_id
+        new_vars: List[Tuple[ScopeTuple, str, str, Variable]] = []
+        new_names: Set[Tuple[ScopeTuple, str]] = set()
+        for spec in specs:
+            scope_tuple, var_str, var = make_var(next_var_id + len(new_vars), *spec)
+            name = spec[1]
+            if (scope_tuple, name) in new_names:
+                raise KeyError(
+                    f'Duplicate var {name} in scope {self._scope_sep.join(scope_tuple)}'
+                )
+            new_names.add((scope_tuple, name))
+            new_vars.append((scope_tuple, name, var_str, var))
+
+        # Only alter state after every spec has been validated
+        for new_var in new_vars:
+            self._add_var(*new_var)
+
+        return [var for _, _, _, var in new_vars]
+
+    def _make_var(
+        self,
+        var_id: int,
+        scope: ScopeInput,
+        name: str,
+        var_type: Union[VarType, str],
+        size: Optional[VariableSize] = None,
+        init: VarValue = None,
+    ) -> Tuple[ScopeTuple, str, 'Variable']:
+        # Validate and build a new variable without altering the writer's state.
         var_type = VarType(var_type)
 
         scope_tuple = self._get_scope_tuple(scope)
 
-        scope_names = self._scope_var_names.setdefault(scope_tuple, set())
-        if name in scope_names:
+        if name in self._scope_var_names.get(scope_tuple, ()):
             raise KeyError(
                 f'Duplicate var {name} in scope {self._scope_sep.join(scope_tuple)}'
             )
@@ -181,9 +285,9 @@ class VCDWriter:
         else:
             var_size = size
 
-        ident = _encode_identifier(self._next_var_id)
+        ident = _encode_identifier(var_id)
 
-        var_str = f'$var {var_type} {var_size} {ident} {name} $end'
+        var_str = f'$var {var_type.value} {var_size} {ident} {name} $end'
 
         var: Variable
         if var_type == VarType.string:
@@ -229,13 +333,16 @@ class VCDWriter:
 
         var.format_value(init, check=True)
 
-        # Only alter state after format_value() succeeds
+        return scope_tuple, var_str, var
+
+    def _add_var(
+        self, scope_tuple: ScopeTuple, name: str, var_str: str, var: 'Variable'
+    ) -> None:
+        # Only called once the variable from _make_var() is known to be valid.
         self._vars.append(var)
         self._next_var_id += 1
         self._scope_var_strs.setdefault(scope_tuple, []).append(var_str)
-        scope_names.add(name)
-
-        return var
+        self._scope_var_names.setdefault(scope_tuple, set()).add(name)
 
     def register_alias(self, scope: ScopeInput, name: str, var: 'Variable') -> None:
         """Register a variable alias.
@@ -265,44 +372,79 @@ class VCDWriter:
                 f'Duplicate var {name} in scope {self._scope_sep.join(scope_tuple)}'
             )
 
-        var_str = f'$var {var.type} {var.size} {var.ident} {name} $end'
+        var_str = f'$var {var.type.value} {var.size} {var.ident} {name} $end'
         self._scope_var_strs.setdefault(scope_tuple, []).append(var_str)
         scope_names.add(name)
 
     def dump_off(self, timestamp: TimeValue) -> None:
-        """Suspend dumping to VCD file."""
+        """Suspend dumping to VCD file.
+
+        :raises VCDPhaseError: if the :class:`VCDWriter` instance is closed.
+
+        """
+        if self._closed:
+            raise VCDPhaseError('Cannot dump_off() after close()')
         if self._registering:
             self._finalize_registration()
         self._set_timestamp(timestamp)
         if not self._dumping:
             return
         self._dump_timestamp()
-        self._ofile.write('$dumpoff\n')
-        for var in self._vars:
-            val_str = var.dump_off()
-            if val_str:
-                self._ofile.write(val_str + '\n')
-        self._ofile.write('$end\n')
+        if self._dump_off_str is None:
+            # The suspended values only depend on the (now fixed) set of variables,
+            # so the section is built once and kept for later dump_off() calls. This
+            # trades one O(#vars) string held for the writer's lifetime for not
+            # re-walking every variable on each dump_off().
+            lines = ['$dumpoff']
+            for var in self._vars:
+                val_str = var.dump_off()
+                if val_str:
+                    lines.append(val_str)
+            lines.append('$end\n')
+            self._dump_off_str = '\n'.join(lines)
+        self._write(self._dump_off_str)
         self._dumping = False
+        self._specialize_change()
 
     def dump_on(self, timestamp: TimeValue) -> None:
-        """Resume dumping to VCD file."""
+        """Resume dumping to VCD file.
+
+        :raises VCDPhaseError: if the :class:`VCDWriter` instance is closed.
+
+        """
+        if self._closed:
+            raise VCDPhaseError('Cannot dump_on() after close()')
         if self._registering:
             self._finalize_registration()
         self._set_timestamp(timestamp)
         if self._dumping:
             return
         self._dumping = True
+        self._specialize_change()
         self._dump_timestamp()
         self._dump_values('$dumpon')
 
     def _dump_values(self, keyword: str) -> None:
-        self._ofile.write(keyword + '\n')
+        check = self._check_values
+        write = self._write
+        write(keyword + '\n')
         for var in self._vars:
-            val_str = var.dump(self._check_values)
+            val_str = var.dump(check)
             if val_str:
-                self._ofile.write(val_str + '\n')
-        self._ofile.write('$end\n')
+                write(val_str + '\n')
+        write('$end\n')
+
+    def _write(self, s: str) -> None:
+        self._buf_append(s)
+        self._buf_len += len(s)
+        if self._buf_len > _BUF_SIZE:
+            self._flush_buf()
+
+    def _flush_buf(self) -> None:
+        if self._buf:
+            self._ofile_write(''.join(self._buf))
+            self._buf.clear()
+            self._buf_len = 0
 
     def _set_timestamp(self, timestamp: TimeValue) -> None:
         if timestamp < self._timestamp:
@@ -315,7 +457,7 @@ class VCDWriter:
             self._last_dumped_ts is None
         ):
             self._last_dumped_ts = self._timestamp
-            self._ofile.write(f'#{self._timestamp}\n')
+            self._write(f'#{self._timestamp}\n')
 
     def change(self, var: 'Variable', timestamp: TimeValue, value: VarValue) -> None:
         """Change variable's value in VCD stream.
@@ -333,6 +475,15 @@ class VCDWriter:
             progresses past 0. The last value change for each variable will go into the
             $dumpvars section.
 
+        .. Note::
+
+            For performance, once the VCD header has been written, ``change``
+            is rebound on the instance to an equivalent implementation
+            specialized for the current phase (dumping, dumping suspended by
+            :meth:`dump_off()`, or closed). This is transparent to callers, but
+            means ``writer.change`` may not be ``VCDWriter.change`` and that each
+            writer holds a reference cycle through its rebound ``change``.
+
         :param Variable var: :class:`Variable` instance (i.e. from
                              :meth:`register_var()`).
         :param int timestamp: Current simulation time.
@@ -349,15 +500,17 @@ class VCDWriter:
             raise VCDPhaseError('Cannot change value after close()')
 
         # Format value early to catch any errors before writing output.
-        if value != var.value or var.type == VarType.event:
+        if value != var.value or var._always_changes:
             val_str = var.format_value(value, self._check_values)
         else:
             val_str = ''
 
         # Unroll for performance: self._set_timestamp(timestamp)
-        if timestamp < self._timestamp:
-            raise VCDPhaseError(f'Out of order timestamp: {timestamp}')
-        elif timestamp > self._timestamp:
+        # The common case of an unchanged timestamp needs only one comparison.
+        prev_timestamp = self._timestamp
+        if timestamp is not prev_timestamp and timestamp != prev_timestamp:
+            if timestamp < prev_timestamp:
+                raise VCDPhaseError(f'Out of order timestamp: {timestamp}')
             if self._registering:
                 self._finalize_registration()
             self._timestamp = int(timestamp)
@@ -367,16 +520,107 @@ class VCDWriter:
 
         var.value = value
         if self._dumping and not self._registering:
-            # Unroll for performance: self._dump_timestamp()
+            # Unroll for performance: self._dump_timestamp() and self._write()
             if self._timestamp != self._last_dumped_ts:
                 self._last_dumped_ts = self._timestamp
-                self._ofile.write(f'#{self._timestamp}\n{val_str}\n')
+                s = f'#{self._timestamp}\n{val_str}\n'
             else:
-                self._ofile.write(f'{val_str}\n')
+                s = f'{val_str}\n'
+            self._buf_append(s)
+            self._buf_len += len(s)
+            if self._buf_len > _BUF_SIZE:
+                self._flush_buf()
+
+    def _specialize_change(self) -> None:
+        # Once registration is finalized, change() is replaced on the instance by a
+        # version specialized for the current phase, which skips the phase checks
+        # that can no longer succeed. Subclasses overriding change() are respected.
+        if type(self).change is not VCDWriter.change:
+            return
+        if self._closed:
+            self.change = self._change_closed  # type: ignore
+        elif self._dumping:
+            self.change = self._change_dumping  # type: ignore
+        else:
+            self.change = self._change_paused  # type: ignore
+
+    def _change_dumping(
+        self, var: 'Variable', timestamp: TimeValue, value: VarValue
+    ) -> None:
+        """Change variable's value in VCD stream while dumping.
+
+        Specialization of :meth:`change()` used after registration while dumping is
+        enabled. See :meth:`change()` for parameters and exceptions.
+
+        """
+        if value != var.value or var._always_changes:
+            val_str = var.format_value(value, self._check_values)
+        else:
+            val_str = ''
+
+        current_timestamp = self._timestamp
+        if timestamp is not current_timestamp and timestamp != current_timestamp:
+            if timestamp < current_timestamp:
+                raise VCDPhaseError(f'Out of order timestamp: {timestamp}')
+            self._timestamp = current_timestamp = int(timestamp)
+
+        if not val_str:
+            return
+
+        var.value = value
+        if current_timestamp != self._last_dumped_ts:
+            self._last_dumped_ts = current_timestamp
+            s = f'#{current_timestamp}\n{val_str}\n'
+        else:
+            s = f'{val_str}\n'
+        self._buf_append(s)
+        self._buf_len += len(s)
+        if self._buf_len > _BUF_SIZE:
+            self._flush_buf()
+
+    def _change_paused(
+        self, var: 'Variable', timestamp: TimeValue, value: VarValue
+    ) -> None:
+        """Change variable's value while dumping is suspended.
+
+        Specialization of :meth:`change()` used after :meth:`dump_off()`. Values are
+        tracked, but not written, until :meth:`dump_on()`. See :meth:`change()` for
+        parameters and exceptions.
+
+        """
+        if value != var.value or var._always_changes:
+            val_str = var.format_value(value, self._check_values)
+        else:
+            val_str = ''
+
+        prev_timestamp = self._timestamp
+        if timestamp is not prev_timestamp and timestamp != prev_timestamp:
+            if timestamp < prev_timestamp:
+                raise VCDPhaseError(f'Out of order timestamp: {timestamp}')
+            self._timestamp = int(timestamp)
+
+        if val_str:
+            var.value = value
+
+    def _change_closed(
+        self, var: 'Variable', timestamp: TimeValue, value: VarValue
+    ) -> None:
+        """Reject value changes after :meth:`close()`.
+
+        Specialization of :meth:`change()` used once the writer is closed.
+
+        :raises VCDPhaseError: always.
+
+        """
+        raise VCDPhaseError('Cannot change value after close()')
 
     def _get_scope_tuple(self, scope: ScopeInput) -> ScopeTuple:
         if isinstance(scope, str):
-            return tuple(scope.split(self._scope_sep))
+            scope_tuple = self._scope_cache.get(scope)
+            if scope_tuple is None:
+                scope_tuple = tuple(scope.split(self._scope_sep))
+                self._scope_cache[scope] = scope_tuple
+            return scope_tuple
         if isinstance(scope, Sequence):
             return tuple(scope)
         else:
@@ -410,8 +654,8 @@ class VCDWriter:
     def close(self, timestamp: Optional[TimeValue] = None) -> None:
         """Close VCD writer.
 
-        Any buffered VCD data is flushed to the output file. After :meth:`close()`, no
-        variable registration or value changes will be accepted.
+        Any buffered VCD data is written and flushed to the output file. After
+        :meth:`close()`, no variable registration or value changes will be accepted.
 
         :param int timestamp: optional final timestamp to insert into VCD stream.
 
@@ -424,10 +668,15 @@ class VCDWriter:
         if not self._closed:
             self.flush(timestamp)
             self._closed = True
+            self._specialize_change()
 
     def flush(self, timestamp: Optional[TimeValue] = None) -> None:
         """Flush any buffered VCD data to output file.
 
+        VCD data is buffered internally and written to the output file in large
+        blocks. Calling :meth:`flush()` or :meth:`close()` ensures all data has been
+        written to the output file.
+
         If the VCD header has not already been written, calling `flush()` will force the
         header to be written thus disallowing any further variable registration.
 
@@ -441,10 +690,12 @@ class VCDWriter:
         if timestamp is not None:
             self._set_timestamp(timestamp)
             self._dump_timestamp()
+        self._flush_buf()
         self._ofile.flush()
 
     def _gen_header(self) -> Generator[str, None, None]:
-        for kwname, kwvalue in sorted(self._header_keywords.items()):
+        for kwname in _HEADER_KEYWORD_ORDER:
+            kwvalue = self._header_keywords[kwname]
             if not kwvalue:
                 continue
             lines = kwvalue.split('\n')
@@ -456,26 +707,26 @@ class VCDWriter:
                     yield '\t' + line
                 yield '$end'
 
+        # Scopes are visited in sorted order, so each scope only needs to leave the
+        # part of the previous scope it does not share and enter the remainder.
         prev_scope: ScopeTuple = ()
         for scope in sorted(self._scope_var_strs):
-            var_strs = self._scope_var_strs.pop(scope)
-
-            for i, (prev, this) in enumerate(zip_longest(prev_scope, scope)):
+            common_len = 0
+            for prev, this in zip(prev_scope, scope):
                 if prev != this:
-                    for _ in prev_scope[i:]:
-                        yield '$upscope $end'
-
-                    for j, name in enumerate(scope[i:]):
-                        scope_type = self._scope_types.get(
-                            scope[: i + j + 1], self._default_scope_type
-                        )
-                        yield f'$scope {scope_type.value} {name} $end'
                     break
-            else:
-                assert scope != prev_scope  # pragma no cover
+                common_len += 1
 
-            for var_str in var_strs:
-                yield var_str
+            for _ in range(len(prev_scope) - common_len):
+                yield '$upscope $end'
+
+            for i in range(common_len, len(scope)):
+                scope_type = self._scope_types.get(
+                    scope[: i + 1], self._default_scope_type
+                )
+                yield f'$scope {scope_type.value} {scope[i]} $end'
+
+            yield from self._scope_var_strs[scope]
 
             prev_scope = scope
 
@@ -486,15 +737,22 @@ class VCDWriter:
 
     def _finalize_registration(self) -> None:
         assert self._registering
-        self._ofile.write('\n'.join(self._gen_header()) + '\n')
+        # Header lines are streamed into the output buffer, which is written out in
+        # blocks, rather than joined into one string for large designs.
+        write = self._write
+        for line in self._gen_header():
+            write(line + '\n')
         if self._vars:
             self._dump_timestamp()
             self._dump_values('$dumpvars')
         self._registering = False
+        self._specialize_change()
 
         # This state is not needed after registration phase.
         self._header_keywords.clear()
         self._scope_types.clear()
+        self._scope_var_strs.clear()
+        self._scope_cache.clear()
         self._scope_var_names.clear()
 
 
@@ -506,6 +764,9 @@ class Variable(Generic[ValueType]):
 
     __slots__ = ('ident', 'type', 'size', 'value')
 
+    # Whether change() emits a value change even if the value is unchanged.
+    _always_changes: ClassVar[bool] = False
+
     def __init__(self, ident: str, type: VarType, size: VariableSize, init: ValueType):
         #: Identifier used in VCD output stream.
         self.ident = ident
@@ -545,8 +806,13 @@ class ScalarVariable(Variable[ScalarValue]):
         :returns: string representing value change for use in a VCD stream.
 
         """
+        try:
+            return _SCALAR_VALUE_CHARS[value] + self.ident
+        except (KeyError, TypeError):
+            pass
+
         if isinstance(value, str):
-            if check and (len(value) != 1 or value not in '01xzXZ'):
+            if check and value not in _SCALAR_CHARS:
                 raise ValueError(f'Invalid scalar value ({value})')
             return value + self.ident
         elif value is None:
@@ -567,6 +833,8 @@ class EventVariable(Variable[EventValue]):
 
     """
 
+    _always_changes = True
+
     def format_value(self, value: EventValue, check: bool = True) -> str:
         if value:
             return '1' + self.ident
@@ -631,7 +899,8 @@ class RealVariable(Variable[RealValue]):
         :returns: string representing value change for use in a VCD stream.
 
         """
-        if not check or isinstance(value, Number):
+        # Test builtin types first to avoid the slower ABC check in the common case.
+        if not check or isinstance(value, (float, int)) or isinstance(value, Number):
             return f'r{value:.16g} {self.ident}'
         else:
             raise ValueError(f'Invalid real value ({value})')
@@ -645,10 +914,19 @@ class VectorVariable(Variable[ScalarValue]):
 
     """
 
-    __slots__ = ()
+    __slots__ = ('_min', '_max', '_suffix')
 
     size: int
 
+    def __init__(
+        self, ident: str, type: VarType, size: VariableSize, init: ScalarValue
+    ):
+        super().__init__(ident, type, size, init)
+        assert isinstance(size, int)
+        # Range limits and value string suffix are precomputed for format_value().
+        self._min, self._max = _vector_limits(size)
+        self._suffix = ' ' + ident
+
     def format_value(self, value: ScalarValue, check: bool = True) -> str:
         """Format value change for VCD stream.
 
@@ -666,8 +944,11 @@ class VectorVariable(Variable[ScalarValue]):
             produce invalid VCD streams with invalid string values.
 
         """
+        if isinstance(value, int):
+            value_str = _format_int_value(value, self.size, self._min, self._max, check)
+            return f'b{value_str}{self._suffix}'
         value_str = _format_scalar_value(value, self.size, check)
-        return f'b{value_str} {self.ident}'
+        return f'b{value_str}{self._suffix}'
 
     def dump_off(self) -> str:
         return self.format_value('x', check=False)
@@ -727,21 +1008,43 @@ class CompoundVectorVariable(Variable[CompoundValue]):
         return self.format_value(tuple('x' * len(self.size)), check=False)
 
 
+@lru_cache(maxsize=None)
+def _vector_limits(size: int) -> Tuple[int, int]:
+    """Get (min, max) for a vector size, shared by all same-sized vectors."""
+    max_val = 1 << size
+    return -(max_val >> 1), max_val
+
+
+def _format_int_value(
+    value: int, size: int, min_val: int, max_val: int, check: bool
+) -> str:
+    """Format int vector value as a binary string.
+
+    Negative values are encoded in two's complement. Unchecked out-of-range values
+    are not truncated to *size* bits.
+
+    """
+    if check and (value < min_val or value >= max_val):
+        raise ValueError(f'Value ({value}) not representable in {size} bits')
+    if value < 0:
+        value += max_val
+        if value < 0:
+            # Only reachable with check=False; keep the sign, as format() does.
+            return format(value, 'b')
+    return bin(value)[2:]
+
+
 def _format_scalar_value(value: ScalarValue, size: int, check: bool) -> str:
     if isinstance(value, int):
-        max_val = 1 << size
-        if check and (-value > (max_val >> 1) or value >= max_val):
-            raise ValueError(f'Value ({value}) not representable in {size} bits')
-        if value < 0:
-            value += max_val
-        return format(value, 'b')
+        min_val, max_val = _vector_limits(size)
+        return _format_int_value(value, size, min_val, max_val, check)
     elif value is None:
         return 'z'
     else:
         if check and (
             not isinstance(value, str)
             or len(value) > size
-            or any(c not in '01xzXZ-' for c in value)
+            or not _VECTOR_CHARS.issuperset(value)
         ):
             raise ValueError(f'Invalid vector value ({value})')
         return value